@@ -1,19 +1,27 @@
 # backend/main.py
 import os
-import base64
-import json
 from io import BytesIO
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from google import genai
 from google.genai import types
 
 from dotenv import load_dotenv
 
+from src.gemini.parse_response import parse_meme_response, record_text_parts
+from src.gemini.scheduler import (
+    DeadlineExceeded,
+    GeminiScheduler,
+    QueueFull,
+    is_quota_error,
+    parse_priority_classes,
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -23,9 +31,42 @@ API_KEY = os.getenv("API_KEY")
 # CONFIG — YOUR API KEY
 # ------------------------- 
 MODEL_NAME = "gemini-3-pro-image-preview"
+RECORD_DIR = os.getenv("GEMINI_RECORD_DIR")
 
 client = genai.Client(api_key=API_KEY)
 
+
+class MemeText(BaseModel):
+    """Response schema for structured output (top/bottom lines + caption)."""
+    top_text: str
+    bottom_text: str
+    caption: str
+
+
+GENERATE_CONFIG = {"response_modalities": ["TEXT", "IMAGE"]}
+# Structured output (response schema) for SDK/model combos that accept it
+# alongside image output; otherwise the text part is parsed from free text.
+if (
+    os.getenv("GEMINI_STRUCTURED_OUTPUT", "0") == "1"
+    and "response_schema" in types.GenerateContentConfig.model_fields
+):
+    GENERATE_CONFIG.update(response_mime_type="application/json", response_schema=MemeText)
+
+# Rate limit + priority classes from our quota, e.g.
+#   GEMINI_RPM=10 GEMINI_BURST=2 GEMINI_PRIORITY_CLASSES="<api key>:0,<api key>:2"
+#   GEMINI_CAMPAIGNS="road_safety,mental_health,cyberbullying"
+# Waiting requests hold a worker thread, so the queue is bounded and every
+# request gets a deadline (GEMINI_MAX_QUEUE, GEMINI_DEFAULT_DEADLINE_S).
+scheduler = GeminiScheduler(
+    client,
+    requests_per_minute=float(os.getenv("GEMINI_RPM", "10")),
+    burst=int(os.getenv("GEMINI_BURST", "2")),
+    max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "16")),
+    default_timeout=float(os.getenv("GEMINI_DEFAULT_DEADLINE_S", "60")),
+    priority_classes=parse_priority_classes(os.getenv("GEMINI_PRIORITY_CLASSES")),
+    campaigns=[c.strip() for c in os.getenv("GEMINI_CAMPAIGNS", "").split(",") if c.strip()],
+)
+
 app = FastAPI(title="Meme Generator (Gemini)")
 
 app.add_middleware(
@@ -40,10 +81,15 @@ class GenerateRequest(BaseModel):
     topic: str
     top_text: Optional[str] = None
     bottom_text: Optional[str] = None
+    # Used for accounting only; names not in GEMINI_CAMPAIGNS are counted as "default"
+    campaign: str = "default"
+    # Seconds the caller is willing to wait; requests that can't finish in time are dropped
+    # (capped at GEMINI_DEFAULT_DEADLINE_S so a client can't park a worker thread indefinitely)
+    deadline_s: Optional[float] = Field(default=None, gt=0)
 
 
 @app.post("/generate")
-async def generate(req: GenerateRequest):
+async def generate(req: GenerateRequest, x_api_key: Optional[str] = Header(default=None)):
     topic = req.topic.strip()
     if not topic:
         raise HTTPException(status_code=400, detail="Topic is required")
@@ -84,56 +130,56 @@ async def generate(req: GenerateRequest):
         """
 
 
+    timeout = scheduler.default_timeout
+    if req.deadline_s is not None:
+        timeout = req.deadline_s if timeout is None else min(req.deadline_s, timeout)
+
     try:
-        response = client.models.generate_content(
+        # Scheduler blocks until admitted, so keep it off the event loop
+        response = await run_in_threadpool(
+            scheduler.generate_content,
+            campaign=req.campaign,
+            api_key=x_api_key,
+            timeout=timeout,
             model=MODEL_NAME,
             contents=prompt,
-            config=types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"]
-            )
+            config=types.GenerateContentConfig(**GENERATE_CONFIG)
         )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Too many queued requests: {e}")
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Request dropped: {e}")
     except Exception as e:
+        if is_quota_error(e):
+            raise HTTPException(status_code=429, detail=f"Gemini quota exceeded: {e}")
         raise HTTPException(status_code=500, detail=f"Gemini request failed: {e}")
 
     # ------------------------------
-    # EXTRACT JSON + IMAGE (WORKING)
+    # EXTRACT JSON + IMAGE
     # ------------------------------
-    caption = None
-    image_b64 = None
+    # Capture raw text parts as parser fixtures (tests/fixtures/gemini_text_parts)
+    if RECORD_DIR:
+        record_text_parts(response, RECORD_DIR, topic)
 
     try:
-        for cand in response.candidates:
-            parts = cand.content.parts
-
-            for part in parts:
-                # TEXT PART
-                if hasattr(part, "text") and part.text:
-                    txt = part.text.strip()
-                    try:
-                        json_obj = json.loads(txt)
-                        caption = json_obj.get("caption")
-                    except:
-                        pass
-
-                # IMAGE PART
-                if hasattr(part, "inline_data") and part.inline_data:
-                    raw = part.inline_data.data  # RAW IMAGE BYTES
-                    if raw:
-                        image_b64 = base64.b64encode(raw).decode("utf-8")
-
-            if image_b64:
-                break
-
-        if not image_b64:
-            raise RuntimeError("Gemini did not return inline_data image")
-
-        if not caption:
-            caption = f"Meme about {topic}"
-
-        return {
-            "caption": caption,
-            "image_b64": image_b64
-        }
-
+        parsed = parse_meme_response(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to parse Gemini response: {e}")
+
+    if not parsed.image_b64:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to parse Gemini response: Gemini did not return inline_data image",
+        )
+
+    return {
+        "caption": parsed.caption or f"Meme about {topic}",
+        "top_text": parsed.top_text,
+        "bottom_text": parsed.bottom_text,
+        "image_b64": parsed.image_b64
+    }
+
+@app.get("/gemini_stats")
+async def gemini_stats():
+    """Per-campaign accounting of Gemini calls, image bytes and latency."""
+    return scheduler.stats()
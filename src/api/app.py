@@ -1,4 +1,6 @@
 # src/api/app.py
+import os
+
 from fastapi import FastAPI
 from pydantic import BaseModel
 from typing import Optional
@@ -6,6 +8,7 @@ from typing import Optional
 from ..caption_model.generate_caption import CaptionGenerator
 from ..vision.select_template import TemplateSelector
 from ..meme_renderer.render_meme import render_meme  # drake-style render
+from .precompute import CaptionPool
 
 app = FastAPI(title="Gov Awareness Meme Generator (Drake Style)")
 
@@ -55,8 +58,31 @@ def split_caption_into_two(caption: str) -> tuple[str, str]:
     return top, bottom
 
 
+# Pre-generated captions + templates for hot topics, refilled in idle time
+caption_pool = CaptionPool(caption_gen, template_selector, split_caption_into_two)
+
+
+@app.on_event("startup")
+def start_caption_pool():
+    if os.getenv("PRECOMPUTE_ENABLED", "1") == "1":
+        caption_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_caption_pool():
+    caption_pool.stop()
+
+
+@app.get("/caption_pool_stats")
+def caption_pool_stats():
+    return caption_pool.stats()
+
+
 @app.post("/generate_meme", response_model=MemeResponse)
 def generate_meme(req: MemeRequest):
+    template_path = None
+    live_topic = None
+
     # ---------- 1) Decide top_text & bottom_text ----------
     if req.top_text and req.bottom_text:
         # User provided both explicitly
@@ -68,15 +94,25 @@ def generate_meme(req: MemeRequest):
         top_text, bottom_text = split_caption_into_two(req.caption_override)
 
     else:
-        # Use AI caption
+        # Use AI caption: precomputed pool first, live generation only on a miss
         topic = req.topic or "generic_awareness"
-        caps = caption_gen.generate(topic, req.tone, req.campaign, num_return_sequences=1)
-        caption = caps[0]
-        top_text, bottom_text = split_caption_into_two(caption)
-
-    # ---------- 2) Choose template with CLIP ----------
-    caption_for_clip = (top_text + " " + bottom_text).strip()
-    template_path, score = template_selector.select(caption_for_clip)
+        pooled = caption_pool.take(topic, req.tone, req.campaign)
+        if pooled is not None:
+            top_text, bottom_text, template_path, score = pooled
+        else:
+            live_topic = topic
+
+    # ---------- 2) Live caption (on a pool miss) + template with CLIP ----------
+    if template_path is None:
+        # Only this path uses GPT-2/CLIP, so only it yields to a running refill batch
+        with caption_pool.live_request():
+            if live_topic is not None:
+                caps = caption_gen.generate(live_topic, req.tone, req.campaign, num_return_sequences=1)
+                caption = caps[0]
+                top_text, bottom_text = split_caption_into_two(caption)
+
+            caption_for_clip = (top_text + " " + bottom_text).strip()
+            template_path, score = template_selector.select(caption_for_clip)
 
     # ---------- 3) Render Drake-style meme ----------
     meme_path = render_meme(template_path, top_text, bottom_text)
@@ -0,0 +1,280 @@
+# src/api/precompute.py
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Recurring awareness topics that make up most of the traffic, written the
+# way users send them: the topic text is also the GPT-2 prompt for the slot.
+HOT_TOPICS = [
+    ("road safety", "humorous", "generic_campaign"),
+    ("mental health", "humorous", "generic_campaign"),
+    ("cyberbullying", "humorous", "generic_campaign"),
+]
+
+PoolKey = Tuple[str, str, str]
+# (top_text, bottom_text, template_path, similarity_score)
+PoolEntry = Tuple[str, str, str, float]
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    'Road Safety ' -> 'road_safety' so free-text topics hit the same pool slot.
+    Lookup key only; prompts use the slot's original topic text.
+    """
+    return "_".join(topic.lower().split())
+
+
+class CaptionPool:
+    def __init__(
+        self,
+        caption_gen,
+        template_selector,
+        split_caption: Callable[[str], Tuple[str, str]],
+        keys: Optional[List[PoolKey]] = None,
+        target_size: int = 16,
+        low_water: int = 4,
+        batch_size: int = 4,
+        interval: float = 5.0,
+        promote_after: int = 3,
+        promote_window: float = 600.0,
+        max_promoted: int = 8,
+        promoted_target_size: int = 4,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Pool of pre-generated (caption, template) pairs per (topic, tone, campaign).
+
+        A background thread tops up every slot that drops below `low_water`,
+        back to `target_size`, using batched GPT-2 decoding and a single CLIP
+        pass per batch. A batch only starts while no live request is in flight,
+        and a live request that arrives mid-batch waits for that one (small)
+        batch only; live requests never wait on each other.
+
+        `keys` (default HOT_TOPICS) are pinned. Other topics are promoted to a
+        slot only after `promote_after` misses within `promote_window` seconds.
+        At most `max_promoted` such slots exist; the least recently used one is
+        evicted to make room. Promoted slots are only filled to
+        `promoted_target_size`, which caps the background work spent on them.
+        """
+        if low_water > target_size:
+            raise ValueError("low_water must be <= target_size")
+        self.caption_gen = caption_gen
+        self.template_selector = template_selector
+        self.split_caption = split_caption
+        self.target_size = target_size
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.interval = interval
+        self.promote_after = promote_after
+        self.promote_window = promote_window
+        self.max_promoted = max_promoted
+        self.promoted_target_size = min(promoted_target_size, target_size)
+        self.clock = clock
+
+        self._pool: Dict[PoolKey, deque] = {}
+        # Topic text each slot is generated from (the key's topic is normalized)
+        self._topics: Dict[PoolKey, str] = {}
+        self._refilling = set()
+        self._pinned = set()
+        self._promoted: "OrderedDict[PoolKey, None]" = OrderedDict()  # LRU order
+        # Recent miss times per unpooled key; bounded so one-off topics can't pile up
+        self._miss_log: "OrderedDict[PoolKey, deque]" = OrderedDict()
+        self._miss_log_size = 256
+        self._lock = threading.Lock()
+        # Live requests and the refill worker share the GPT-2/CLIP models:
+        # `_busy` marks a refill batch on the models, `_in_flight` live requests.
+        self._cond = threading.Condition(self._lock)
+        self._busy = False
+        self._in_flight = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refill_errors = 0
+        self.last_error: Optional[str] = None
+
+        for topic, tone, campaign in keys if keys is not None else HOT_TOPICS:
+            key = self._key(topic, tone, campaign)
+            self._pinned.add(key)
+            self._pool[key] = deque()
+            self._topics[key] = topic.strip()
+
+    @staticmethod
+    def _key(topic: str, tone: str, campaign: str) -> PoolKey:
+        return normalize_topic(topic), tone, campaign
+
+    def _target(self, key: PoolKey) -> int:
+        return self.target_size if key in self._pinned else self.promoted_target_size
+
+    def _low_water(self, key: PoolKey) -> int:
+        return min(self.low_water, self._target(key))
+
+    # ---------- serving ----------
+    def take(self, topic: str, tone: str, campaign: str) -> Optional[PoolEntry]:
+        """O(1) pop of a precomputed entry, or None on a miss."""
+        key = self._key(topic, tone, campaign)
+        with self._lock:
+            slot = self._pool.get(key)
+            if slot is None:
+                self.misses += 1
+                self._note_miss(key, topic)
+                return None
+            if key in self._promoted:
+                self._promoted.move_to_end(key)
+            entry = slot.popleft() if slot else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(slot) < self._low_water(key):
+                self._wake.set()
+            return entry
+
+    def _note_miss(self, key: PoolKey, topic: str):
+        """Record a miss for an unpooled key; promote it once it recurs often enough."""
+        now = self.clock()
+        times = self._miss_log.pop(key, None) or deque()
+        while times and now - times[0] > self.promote_window:
+            times.popleft()
+        times.append(now)
+        if len(times) < self.promote_after:
+            self._miss_log[key] = times
+            if len(self._miss_log) > self._miss_log_size:
+                self._miss_log.popitem(last=False)
+            return
+
+        if len(self._promoted) >= self.max_promoted:
+            evicted, _ = self._promoted.popitem(last=False)
+            del self._pool[evicted]
+            del self._topics[evicted]
+            self._refilling.discard(evicted)
+        self._promoted[key] = None
+        self._pool[key] = deque()
+        self._topics[key] = topic.strip()
+        self._wake.set()
+
+    @contextmanager
+    def live_request(self):
+        """
+        Mark a live request as in flight so the refill worker stays idle.
+        Wrap only the code that runs GPT-2/CLIP; pool hits via `take()` need no guard.
+        """
+        with self._cond:
+            while self._busy:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self._wake.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "worker_alive": self._thread is not None and self._thread.is_alive(),
+                "refill_errors": self.refill_errors,
+                "last_error": self.last_error,
+                "slots": {"|".join(k): len(v) for k, v in self._pool.items()},
+                "promoted": ["|".join(k) for k in self._promoted],
+            }
+
+    # ---------- refilling ----------
+    def _next_batch(self) -> List[PoolKey]:
+        """
+        Up to `batch_size` prompts, spread round-robin across slots being refilled.
+        Caller holds the lock.
+        """
+        # Slots that dipped below low water keep refilling until they reach target
+        for key, slot in self._pool.items():
+            if len(slot) < self._low_water(key):
+                self._refilling.add(key)
+        deficits = {}
+        for key in list(self._refilling):
+            missing = self._target(key) - len(self._pool[key])
+            if missing > 0:
+                deficits[key] = missing
+            else:
+                self._refilling.discard(key)
+        batch = []
+        while deficits and len(batch) < self.batch_size:
+            for key in list(deficits):
+                batch.append(key)
+                deficits[key] -= 1
+                if deficits[key] <= 0:
+                    del deficits[key]
+                if len(batch) >= self.batch_size:
+                    break
+        return batch
+
+    def refill_once(self) -> int:
+        """
+        Generate one batch for slots being refilled, unless a live request is in
+        flight. Returns entries added.
+        """
+        with self._cond:
+            if self._in_flight:
+                return 0
+            batch = self._next_batch()
+            if not batch:
+                return 0
+            # Same prompt text the live path would use for this topic
+            prompts = [(self._topics[key], key[1], key[2]) for key in batch]
+            self._busy = True
+
+        try:
+            caps = self.caption_gen.generate_batch(prompts, num_return_sequences=1)
+            texts = [self.split_caption(c[0]) for c in caps]
+            templates = self.template_selector.select_batch(
+                [(top + " " + bottom).strip() for top, bottom in texts]
+            )
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+        with self._lock:
+            for key, (top, bottom), (path, score) in zip(batch, texts, templates):
+                slot = self._pool.get(key)
+                if slot is not None and len(slot) < self._target(key):
+                    slot.append((top, bottom, path, score))
+        return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.refill_once():
+                    # Keep going while there is work and nobody is waiting on the models
+                    continue
+            except Exception as e:
+                # One bad batch (CUDA OOM, tokenizer error, ...) must not kill the worker
+                with self._lock:
+                    self.refill_errors += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+                print(f"[CaptionPool] Refill failed, retrying in {self.interval}s: {self.last_error}")
+                self._stop.wait(self.interval)
+                continue
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="caption-precompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,4 +1,6 @@
 import os
+from typing import List, Tuple
+
 import torch
 from transformers import GPT2LMHeadModel, GPT2TokenizerFast
 
@@ -50,8 +52,26 @@ class CaptionGenerator:
             self.model = GPT2LMHeadModel.from_pretrained(BASE_MODEL_NAME)
 
         self.tokenizer.pad_token = self.tokenizer.eos_token
+        # GPT-2 is decoder-only: pad on the left so batched generation continues
+        # from the prompt. Set once here; single-prompt `generate` doesn't pad.
+        self.tokenizer.padding_side = "left"
         self.model.to(self.device)
 
+    @staticmethod
+    def build_prompt(topic: str, tone: str, campaign: str) -> str:
+        return (
+            f"topic: {topic} | "
+            f"tone: {tone} | "
+            f"campaign: {campaign} | "
+            f"meme_caption:"
+        )
+
+    def _decode_caption(self, output) -> str:
+        text = self.tokenizer.decode(output, skip_special_tokens=True)
+        # keep only part after "meme_caption:"
+        cap = text.split("meme_caption:")[-1].strip()
+        return cap.split("\n")[0]
+
     def generate(
         self,
         topic: str,
@@ -64,12 +84,7 @@ class CaptionGenerator:
         Generate meme captions given topic, tone, and campaign.
         """
 
-        prompt = (
-            f"topic: {topic} | "
-            f"tone: {tone} | "
-            f"campaign: {campaign} | "
-            f"meme_caption:"
-        )
+        prompt = self.build_prompt(topic, tone, campaign)
 
         input_ids = self.tokenizer.encode(prompt, return_tensors="pt").to(self.device)
 
@@ -84,15 +99,40 @@ class CaptionGenerator:
                 pad_token_id=self.tokenizer.eos_token_id,
             )
 
-        captions = []
-        for o in outputs:
-            text = self.tokenizer.decode(o, skip_special_tokens=True)
-            # keep only part after "meme_caption:"
-            cap = text.split("meme_caption:")[-1].strip()
-            cap = cap.split("\n")[0]
-            captions.append(cap)
-        return captions
+        return [self._decode_caption(o) for o in outputs]
+
+    def generate_batch(
+        self,
+        requests: List[Tuple[str, str, str]],
+        max_new_tokens: int = 25,
+        num_return_sequences: int = 1,
+    ) -> List[List[str]]:
+        """
+        Batched version of `generate` for offline/precompute use.
+        `requests` is a list of (topic, tone, campaign); returns one list of
+        `num_return_sequences` captions per request, in the same order.
+        """
+        if not requests:
+            return []
+
+        prompts = [self.build_prompt(*r) for r in requests]
+        enc = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **enc,
+                max_new_tokens=max_new_tokens,
+                temperature=0.9,
+                top_p=0.95,
+                do_sample=True,
+                num_return_sequences=num_return_sequences,
+                pad_token_id=self.tokenizer.eos_token_id,
+            )
 
+        # outputs are grouped per prompt: [p0_s0, p0_s1, ..., p1_s0, ...]
+        captions = [self._decode_caption(o) for o in outputs]
+        n = num_return_sequences
+        return [captions[i * n:(i + 1) * n] for i in range(len(requests))]
 
 if __name__ == "__main__":
     gen = CaptionGenerator()
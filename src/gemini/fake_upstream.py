@@ -0,0 +1,84 @@
+# src/gemini/fake_upstream.py
+#
+# Local stand-in for `genai.Client` that enforces a request quota, so the
+# scheduler can be exercised without network access or burning real quota.
+# The quota is a plain fixed-window counter (deliberately not the scheduler's
+# TokenBucket) so it can catch bugs in the scheduler's own rate limiting.
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+# Smallest valid PNG (1x1 transparent pixel)
+FAKE_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+class FakeQuotaError(Exception):
+    """Mimics google.genai.errors.APIError for HTTP 429 RESOURCE_EXHAUSTED."""
+
+    def __init__(self, message: str = "RESOURCE_EXHAUSTED"):
+        super().__init__(message)
+        self.code = 429
+
+
+class FixedWindowQuota:
+    def __init__(self, limit: int, window: float = 60.0, clock=time.monotonic):
+        """At most `limit` requests per aligned `window` seconds."""
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.current_window = None
+        self.count = 0
+
+    def allow(self) -> bool:
+        window = int(self.clock() // self.window)
+        if window != self.current_window:
+            self.current_window = window
+            self.count = 0
+        if self.count >= self.limit:
+            return False
+        self.count += 1
+        return True
+
+
+class FakeModels:
+    def __init__(self, requests_per_minute: int, latency: float, text: str = None, clock=time.monotonic):
+        self.quota = FixedWindowQuota(requests_per_minute, 60.0, clock)
+        self.clock = clock
+        self.latency = latency
+        self.text = text or json.dumps({
+            "top_text": "New rule announced",
+            "bottom_text": "Me pretending I knew all along",
+            "caption": "Fake meme caption",
+        })
+        self.accepted = 0
+        self.rejected = 0
+        # (clock time, contents) of every accepted call, in arrival order
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, model: str = None, contents=None, config=None):
+        with self._lock:
+            if not self.quota.allow():
+                self.rejected += 1
+                raise FakeQuotaError()
+            self.accepted += 1
+            self.calls.append((self.clock(), contents))
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = [
+            SimpleNamespace(text=self.text, inline_data=None),
+            SimpleNamespace(text=None, inline_data=SimpleNamespace(data=FAKE_PNG, mime_type="image/png")),
+        ]
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+
+
+class FakeGeminiClient:
+    def __init__(self, requests_per_minute: int = 10, latency: float = 0.0, text: str = None,
+                 clock=time.monotonic):
+        self.models = FakeModels(requests_per_minute, latency, text, clock)
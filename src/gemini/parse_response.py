@@ -0,0 +1,189 @@
+# src/gemini/parse_response.py
+
+import base64
+import json
+import os
+import time
+from typing import Optional
+
+_decoder = json.JSONDecoder()
+TEXT_KEYS = ("top_text", "bottom_text", "caption")
+
+
+class ParsedMeme:
+    __slots__ = ("top_text", "bottom_text", "caption", "image_b64")
+
+    def __init__(self):
+        self.top_text: Optional[str] = None
+        self.bottom_text: Optional[str] = None
+        self.caption: Optional[str] = None
+        self.image_b64: Optional[str] = None
+
+    def has_text(self) -> bool:
+        return bool(self.caption or self.top_text or self.bottom_text)
+
+    def apply(self, obj: dict):
+        for key in TEXT_KEYS:
+            value = obj.get(key)
+            if isinstance(value, str) and value.strip():
+                setattr(self, key, value.strip())
+
+
+def extract_json_object(text: str) -> Optional[dict]:
+    """
+    Find the first JSON object in `text` that carries meme fields.
+    Handles bare JSON, ```json fences and JSON embedded in prose without
+    copying the string: raw_decode parses in place starting at each '{'.
+    """
+    idx = text.find("{")
+    while idx != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, idx)
+        except ValueError:
+            idx = text.find("{", idx + 1)
+            continue
+        if isinstance(obj, dict) and any(k in obj for k in TEXT_KEYS):
+            return obj
+        # Valid JSON but not ours (e.g. nested example); keep scanning after it
+        idx = text.find("{", end)
+    return None
+
+
+def _structured(response) -> Optional[dict]:
+    # Populated by the SDK when a response_schema was supplied
+    parsed = getattr(response, "parsed", None)
+    if parsed is None:
+        return None
+    if isinstance(parsed, dict):
+        return parsed
+    if hasattr(parsed, "model_dump"):  # pydantic model
+        return parsed.model_dump()
+    return None
+
+
+def parse_meme_response(response) -> ParsedMeme:
+    """
+    Extract top_text / bottom_text / caption and the first inline image from a
+    Gemini multimodal response. Stops as soon as both text and image are found.
+    Thought parts (interim drafts from thinking models) are skipped, so the
+    result comes from the final answer only.
+    """
+    result = ParsedMeme()
+    structured = _structured(response)
+    if structured:
+        result.apply(structured)
+    have_text = result.has_text()
+    image_b64 = None
+
+    # Text parts that didn't contain a full object on their own; the model
+    # sometimes splits the JSON across parts.
+    leftovers = []
+
+    for cand in getattr(response, "candidates", None) or ():
+        content = getattr(cand, "content", None)
+        for part in getattr(content, "parts", None) or ():
+            if getattr(part, "thought", False):
+                continue
+
+            if not have_text:
+                txt = part.text
+                if txt:
+                    obj = extract_json_object(txt)
+                    if obj is not None:
+                        result.apply(obj)
+                        have_text = result.has_text()
+                    else:
+                        leftovers.append(txt)
+
+            if image_b64 is None:
+                inline = part.inline_data
+                if inline is not None and inline.data:
+                    image_b64 = base64.b64encode(inline.data).decode("ascii")
+
+            if have_text and image_b64 is not None:
+                break
+        else:
+            continue
+        break
+
+    if not have_text and len(leftovers) > 1:
+        obj = extract_json_object("".join(leftovers))
+        if obj is not None:
+            result.apply(obj)
+
+    if not result.caption and (result.top_text or result.bottom_text):
+        result.caption = " ".join(t for t in (result.top_text, result.bottom_text) if t)
+    result.image_b64 = image_b64
+    return result
+
+
+def record_text_parts(response, directory: str, topic: str = "") -> Optional[str]:
+    """
+    Save the raw text parts of a live response as a fixture file (see
+    tests/fixtures/gemini_text_parts). Thought parts are kept, marked
+    {"text": ..., "thought": true}. Add an "expected" block by hand before
+    committing it.
+    """
+    texts = []
+    for cand in getattr(response, "candidates", None) or []:
+        content = getattr(cand, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            txt = getattr(part, "text", None)
+            if txt:
+                texts.append({"text": txt, "thought": True} if getattr(part, "thought", False) else txt)
+    if not texts:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"recorded_{time.time_ns()}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"source": "recorded", "topic": topic, "parts": texts}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    # Benchmark over the fixture corpus against the loop main.py used before
+    import glob
+    import timeit
+    from types import SimpleNamespace
+
+    from .fake_upstream import FAKE_PNG
+
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    FIXTURES_DIR = os.path.join(BASE_DIR, "tests", "fixtures", "gemini_text_parts")
+
+    def make_response(texts):
+        parts = [
+            SimpleNamespace(text=t["text"], thought=True, inline_data=None) if isinstance(t, dict)
+            else SimpleNamespace(text=t, inline_data=None)
+            for t in texts
+        ]
+        parts.append(SimpleNamespace(text=None, inline_data=SimpleNamespace(data=FAKE_PNG)))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
+
+    def legacy_caption(response):
+        # The loop main.py used before: json.loads per part, image re-encoded every time
+        caption = None
+        for cand in response.candidates:
+            for part in cand.content.parts:
+                if getattr(part, "text", None):
+                    try:
+                        caption = json.loads(part.text.strip()).get("caption")
+                    except Exception:
+                        pass
+                if getattr(part, "inline_data", None) and part.inline_data.data:
+                    base64.b64encode(part.inline_data.data).decode("utf-8")
+        return caption
+
+    n = 20000
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        resp = make_response(fixture["parts"])
+        parsed = parse_meme_response(resp)
+        t_new = min(timeit.repeat(lambda: parse_meme_response(resp), number=n, repeat=3)) / n * 1e6
+        t_old = min(timeit.repeat(lambda: legacy_caption(resp), number=n, repeat=3)) / n * 1e6
+        print(
+            f"{os.path.basename(path):28s} found={parsed.caption is not None!s:5s} "
+            f"legacy_found={legacy_caption(resp) is not None!s:5s} "
+            f"new={t_new:.1f}us legacy={t_old:.1f}us"
+        )
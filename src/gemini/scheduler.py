@@ -0,0 +1,327 @@
+# src/gemini/scheduler.py
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Quota defaults. Gemini quotas are expressed per minute.
+DEFAULT_RPM = 10.0
+DEFAULT_BURST = 2
+# Keep the wait queue well below the server's worker-thread pool (AnyIO default: 40),
+# so queued requests can't starve everything else of threads.
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_TIMEOUT = 60.0
+
+# Lower number = served first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+DEFAULT_CLASS = "default"
+
+
+class DeadlineExceeded(Exception):
+    """Request was dropped because it could no longer finish before its deadline."""
+
+
+class QueueFull(Exception):
+    """Request was rejected because too many requests are already waiting."""
+
+
+def parse_priority_classes(spec: Optional[str]) -> Dict[str, int]:
+    """
+    Parse 'api_key:priority,...' (e.g. 'k-road-safety-team:0,k-intern:2').
+    """
+    classes = {}
+    if not spec:
+        return classes
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        name, prio = item.rsplit(":", 1)
+        classes[name.strip()] = int(prio)
+    return classes
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        """
+        Classic token bucket: refills at `rate_per_sec`, holds at most `capacity` tokens.
+        Not thread-safe on its own; the scheduler guards it with its lock.
+        """
+        if rate_per_sec <= 0 or capacity < 1:
+            raise ValueError("rate_per_sec must be > 0 and capacity >= 1")
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.last = clock()
+
+    @classmethod
+    def from_quota(cls, requests_per_minute: float, burst: int = 1, **kwargs) -> "TokenBucket":
+        return cls(requests_per_minute / 60.0, burst, **kwargs)
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until one token will be available."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self):
+        """Upstream told us we're over quota: back off until a full token refills."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class CampaignStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.image_bytes = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.total_latency / self.calls if self.calls else 0.0
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "image_bytes": self.image_bytes,
+            "avg_latency_s": round(avg, 4),
+            "max_latency_s": round(self.max_latency, 4),
+        }
+
+
+def response_image_bytes(response) -> int:
+    """Sum of inline image bytes in a generate_content response."""
+    total = 0
+    for cand in getattr(response, "candidates", None) or []:
+        content = getattr(cand, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            inline = getattr(part, "inline_data", None)
+            if inline is not None and inline.data:
+                total += len(inline.data)
+    return total
+
+
+def is_quota_error(exc: Exception) -> bool:
+    # google.genai.errors.APIError exposes the HTTP status as `.code`
+    return getattr(exc, "code", None) == 429
+
+
+class GeminiScheduler:
+    def __init__(
+        self,
+        client,
+        requests_per_minute: float = DEFAULT_RPM,
+        burst: int = DEFAULT_BURST,
+        priority_classes: Optional[Dict[str, int]] = None,
+        campaigns: Optional[Iterable[str]] = None,
+        default_priority: int = PRIORITY_NORMAL,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        default_timeout: Optional[float] = DEFAULT_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Sits in front of a `genai.Client` and admits calls one at a time according to:
+        - a token bucket sized from our quota (requests/minute + burst),
+        - priority classes keyed by configured API keys (lower = sooner); unknown
+          or missing keys get `default_priority`,
+        - per-request deadlines (`default_timeout` when the caller gives none):
+          work that can't finish in time is dropped instead of burning quota,
+        - a bounded wait queue: beyond `max_queue` waiters, requests are
+          rejected immediately with QueueFull.
+
+        Accounting is per campaign, but only for the configured `campaigns`;
+        anything else is counted under "default" so caller-supplied names
+        can't grow the stats without bound.
+
+        Callers block in `generate_content()` until admitted, so call it from a
+        worker thread when inside an async endpoint.
+        """
+        self.client = client
+        self.bucket = TokenBucket.from_quota(requests_per_minute, burst, clock=clock)
+        self.priority_classes = dict(priority_classes or {})
+        self.campaigns = frozenset(campaigns or ())
+        self.default_priority = default_priority
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq, ticket)
+        self._seq = itertools.count()
+        self._stats: Dict[str, CampaignStats] = {}
+        # EWMA of upstream latency, used to predict whether a deadline is still reachable
+        self._latency_estimate = 0.0
+
+    # ---------- priority / accounting ----------
+    def priority_for(self, api_key: Optional[str] = None) -> int:
+        # Only keys we issued carry a priority; the request body is not trusted
+        if api_key is not None and api_key in self.priority_classes:
+            return self.priority_classes[api_key]
+        return self.default_priority
+
+    def account_for(self, campaign: Optional[str]) -> str:
+        return campaign if campaign in self.campaigns else DEFAULT_CLASS
+
+    def _campaign_stats(self, campaign: str) -> CampaignStats:
+        stats = self._stats.get(campaign)
+        if stats is None:
+            stats = self._stats[campaign] = CampaignStats()
+        return stats
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            return {name: s.as_dict() for name, s in self._stats.items()}
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def wake(self):
+        """Make waiters re-check admission now (e.g. after an injected clock moved)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    # ---------- admission ----------
+    def _cannot_finish(self, deadline: Optional[float], now: float) -> bool:
+        return deadline is not None and now + self._latency_estimate > deadline
+
+    def _acquire(self, priority: int, deadline: Optional[float]):
+        ticket = object()
+        entry = (priority, next(self._seq), ticket)
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull(f"{len(self._queue)} requests already waiting")
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = self.clock()
+                    if self._cannot_finish(deadline, now):
+                        raise DeadlineExceeded(
+                            f"Deadline cannot be met (expected latency {self._latency_estimate:.2f}s)"
+                        )
+                    if self._queue[0][2] is ticket and self.bucket.try_take():
+                        return
+                    timeout = self.bucket.wait_time() if self._queue[0][2] is ticket else None
+                    if deadline is not None:
+                        remaining = deadline - self._latency_estimate - now
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+                    self._cond.wait(timeout)
+            finally:
+                # Always leave the queue, whether admitted or dropped
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def submit(
+        self,
+        fn: Callable[[], Any],
+        campaign: Optional[str] = None,
+        api_key: Optional[str] = None,
+        priority: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Run `fn()` once admitted. `timeout` is the request deadline in seconds from now
+        (defaults to `default_timeout`).
+        Raises QueueFull or DeadlineExceeded if the request was dropped.
+        """
+        if priority is None:
+            priority = self.priority_for(api_key)
+        campaign = self.account_for(campaign)
+        if timeout is None:
+            timeout = self.default_timeout
+        deadline = self.clock() + timeout if timeout is not None else None
+
+        try:
+            self._acquire(priority, deadline)
+        except (QueueFull, DeadlineExceeded):
+            with self._cond:
+                self._campaign_stats(campaign).dropped += 1
+            raise
+
+        start = self.clock()
+        try:
+            result = fn()
+        except Exception as e:
+            with self._cond:
+                self._campaign_stats(campaign).errors += 1
+                if is_quota_error(e):
+                    self.bucket.drain()
+            raise
+
+        latency = self.clock() - start
+        image_bytes = response_image_bytes(result)
+        with self._cond:
+            stats = self._campaign_stats(campaign)
+            stats.calls += 1
+            stats.image_bytes += image_bytes
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if self._latency_estimate == 0.0:
+                self._latency_estimate = latency
+            else:
+                self._latency_estimate = 0.8 * self._latency_estimate + 0.2 * latency
+        return result
+
+    def generate_content(self, campaign: Optional[str] = None, api_key: Optional[str] = None,
+                         priority: Optional[int] = None, timeout: Optional[float] = None, **kwargs):
+        """Scheduled drop-in for `client.models.generate_content(**kwargs)`."""
+        return self.submit(
+            lambda: self.client.models.generate_content(**kwargs),
+            campaign=campaign,
+            api_key=api_key,
+            priority=priority,
+            timeout=timeout,
+        )
+
+
+if __name__ == "__main__":
+    # Smoke test against the local fake upstream (no network / API key needed)
+    from .fake_upstream import FakeGeminiClient
+
+    upstream = FakeGeminiClient(requests_per_minute=120, latency=0.05)
+    sched = GeminiScheduler(upstream, requests_per_minute=120, burst=2,
+                            priority_classes={"road-safety-key": PRIORITY_HIGH},
+                            campaigns=["road_safety"])
+
+    def worker(campaign, api_key, timeout):
+        try:
+            sched.generate_content(campaign=campaign, api_key=api_key, timeout=timeout,
+                                   model="fake", contents="hi")
+        except (QueueFull, DeadlineExceeded):
+            pass
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=("road_safety", "road-safety-key", 2.0) if i % 3 == 0 else ("generic", None, 2.0),
+        )
+        for i in range(12)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print("upstream quota errors:", upstream.models.rejected)
+    for name, s in sched.stats().items():
+        print(name, s)
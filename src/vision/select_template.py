@@ -4,7 +4,7 @@ import os
 import pickle
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from typing import Tuple
+from typing import List, Tuple
 
 from .build_image_index import build_index
 
@@ -60,6 +60,16 @@ class TemplateSelector:
         idx = int(np.argmax(sims))
         return self.filenames[idx], float(sims[idx])
 
+    def select_batch(self, captions: List[str]) -> List[Tuple[str, float]]:
+        """Same as `select` for many captions, encoded in a single forward pass."""
+        if not captions:
+            return []
+        text_embs = self.model.encode(captions, convert_to_numpy=True)
+        text_embs = text_embs / np.linalg.norm(text_embs, axis=1, keepdims=True)
+        sims = np.dot(text_embs, self.image_embeddings.T)
+        idxs = np.argmax(sims, axis=1)
+        return [(self.filenames[int(i)], float(sims[row, i])) for row, i in enumerate(idxs)]
+
 
 if __name__ == "__main__":
     selector = TemplateSelector()
@@ -0,0 +1,91 @@
+# tests/test_parse_response.py
+import base64
+import glob
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from src.gemini.fake_upstream import FAKE_PNG
+from src.gemini.parse_response import extract_json_object, parse_meme_response
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "gemini_text_parts")
+FIXTURES = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json")))
+
+
+def text_part(t):
+    # Fixture parts are plain strings, or {"text": ..., "thought": true} for thought parts
+    if isinstance(t, dict):
+        return SimpleNamespace(text=t["text"], thought=t.get("thought", False), inline_data=None)
+    return SimpleNamespace(text=t, thought=None, inline_data=None)
+
+
+def make_response(texts, image=FAKE_PNG, parsed=None):
+    parts = [text_part(t) for t in texts]
+    if image is not None:
+        parts.append(SimpleNamespace(text=None, inline_data=SimpleNamespace(data=image)))
+    return SimpleNamespace(
+        parsed=parsed,
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))],
+    )
+
+
+def test_fixture_corpus_is_present():
+    assert len(FIXTURES) >= 8
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_fixture_extraction(path):
+    with open(path, encoding="utf-8") as f:
+        fixture = json.load(f)
+
+    parsed = parse_meme_response(make_response(fixture["parts"]))
+
+    expected = fixture["expected"]
+    assert parsed.top_text == expected["top_text"]
+    assert parsed.bottom_text == expected["bottom_text"]
+    assert parsed.caption == expected["caption"]
+    assert base64.b64decode(parsed.image_b64) == FAKE_PNG
+
+
+def test_structured_output_takes_precedence():
+    parsed = parse_meme_response(make_response(
+        ["not json at all"],
+        parsed={"top_text": "A", "bottom_text": "B", "caption": "C"},
+    ))
+    assert (parsed.top_text, parsed.bottom_text, parsed.caption) == ("A", "B", "C")
+
+
+def test_stops_at_first_image_once_text_found():
+    second = SimpleNamespace(text='{"caption": "late"}', inline_data=SimpleNamespace(data=b"other"))
+    resp = make_response(['{"caption": "first"}'])
+    resp.candidates.append(SimpleNamespace(content=SimpleNamespace(parts=[second])))
+
+    parsed = parse_meme_response(resp)
+    assert parsed.caption == "first"
+    assert base64.b64decode(parsed.image_b64) == FAKE_PNG
+
+
+def test_missing_image_is_reported_as_none():
+    parsed = parse_meme_response(make_response(['{"caption": "x"}'], image=None))
+    assert parsed.caption == "x"
+    assert parsed.image_b64 is None
+
+
+def test_unrelated_json_object_is_skipped():
+    assert extract_json_object('{"a": 1} then {"caption": "ok"}') == {"caption": "ok"}
+    assert extract_json_object("{broken") is None
+
+
+def test_thought_parts_are_skipped():
+    draft = SimpleNamespace(text='{"caption": "draft"}', thought=True,
+                            inline_data=SimpleNamespace(data=b"draft image"))
+    draft_image = SimpleNamespace(text=None, thought=True,
+                                  inline_data=SimpleNamespace(data=b"another draft"))
+    resp = make_response(['{"caption": "final"}'])
+    resp.candidates[0].content.parts[:0] = [draft, draft_image]
+
+    parsed = parse_meme_response(resp)
+    assert parsed.caption == "final"
+    assert base64.b64decode(parsed.image_b64) == FAKE_PNG
@@ -0,0 +1,230 @@
+# tests/test_precompute.py
+import threading
+import time
+
+from src.api.precompute import CaptionPool
+
+
+class FakeCaptionGenerator:
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.prompts = 0
+
+    def generate_batch(self, requests, num_return_sequences=1):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("CUDA out of memory")
+        self.prompts += len(requests)
+        return [[f"{topic} caption with enough words to split"] for topic, _, _ in requests]
+
+
+class FakeTemplateSelector:
+    def select_batch(self, captions):
+        return [("templates/drake.jpg", 0.5) for _ in captions]
+
+
+def split(caption):
+    words = caption.split()
+    mid = len(words) // 2
+    return " ".join(words[:mid]), " ".join(words[mid:])
+
+
+def wait_for(predicate, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_worker_survives_refill_errors():
+    gen = FakeCaptionGenerator(fail_times=2)
+    pool = CaptionPool(gen, FakeTemplateSelector(), split, target_size=4, low_water=2, interval=0.01)
+    pool.start()
+    try:
+        wait_for(lambda: all(n == 4 for n in pool.stats()["slots"].values()))
+        stats = pool.stats()
+        assert stats["worker_alive"] is True
+        assert stats["refill_errors"] == 2
+        assert "CUDA out of memory" in stats["last_error"]
+    finally:
+        pool.stop()
+    assert pool.stats()["worker_alive"] is False
+
+
+def test_hit_serves_precomputed_entry():
+    pool = CaptionPool(FakeCaptionGenerator(), FakeTemplateSelector(), split, target_size=2, low_water=1)
+    while pool.refill_once():
+        pass
+
+    top, bottom, template, score = pool.take("Road Safety", "humorous", "generic_campaign")
+    assert (top, bottom) == split("road safety caption with enough words to split")
+    assert template == "templates/drake.jpg"
+    assert pool.stats()["hits"] == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fill(pool):
+    while pool.refill_once():
+        pass
+
+
+def test_one_off_topics_are_never_promoted():
+    gen = FakeCaptionGenerator()
+    pool = CaptionPool(gen, FakeTemplateSelector(), split, target_size=16, low_water=4)
+    fill(pool)
+    hot_prompts = gen.prompts
+
+    for i in range(40):
+        assert pool.take(f"one-off topic {i}", "humorous", "generic_campaign") is None
+    fill(pool)
+
+    assert gen.prompts == hot_prompts
+    assert len(pool.stats()["slots"]) == 3
+
+
+def test_recurring_topic_is_promoted_with_capped_work():
+    clock = FakeClock()
+    gen = FakeCaptionGenerator()
+    pool = CaptionPool(gen, FakeTemplateSelector(), split, target_size=16, low_water=4,
+                       promote_after=3, promote_window=60, promoted_target_size=4, clock=clock)
+    fill(pool)
+    hot_prompts = gen.prompts
+
+    # Misses spread wider than the window don't count together
+    for t in (0, 100, 200):
+        clock.now = t
+        pool.take("save water", "humorous", "generic_campaign")
+    assert pool.stats()["promoted"] == []
+
+    for t in (300, 310, 320):
+        clock.now = t
+        pool.take("save water", "humorous", "generic_campaign")
+    assert pool.stats()["promoted"] == ["save_water|humorous|generic_campaign"]
+
+    fill(pool)
+    assert gen.prompts - hot_prompts == 4
+    assert pool.take("Save Water", "humorous", "generic_campaign") is not None
+
+
+def test_lru_eviction_never_removes_hot_topics():
+    clock = FakeClock()
+    pool = CaptionPool(FakeCaptionGenerator(), FakeTemplateSelector(), split,
+                       promote_after=1, max_promoted=2, clock=clock)
+
+    for topic in ("a", "b"):
+        pool.take(topic, "humorous", "generic_campaign")
+    pool.take("a", "humorous", "generic_campaign")  # "a" is now most recently used
+    pool.take("c", "humorous", "generic_campaign")
+
+    stats = pool.stats()
+    assert stats["promoted"] == ["a|humorous|generic_campaign", "c|humorous|generic_campaign"]
+    for hot in ("road_safety", "mental_health", "cyberbullying"):
+        assert f"{hot}|humorous|generic_campaign" in stats["slots"]
+
+
+class BlockingCaptionGenerator(FakeCaptionGenerator):
+    """Holds each batch until released, to observe live requests during a refill."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_batch(self, requests, num_return_sequences=1):
+        self.started.set()
+        self.release.wait(5)
+        return super().generate_batch(requests, num_return_sequences)
+
+
+def test_live_requests_do_not_serialize_without_refill():
+    pool = CaptionPool(FakeCaptionGenerator(), FakeTemplateSelector(), split)
+    inside = threading.Barrier(3, timeout=5)
+
+    def live():
+        with pool.live_request():
+            inside.wait()  # all three must be inside at once
+
+    threads = [threading.Thread(target=live) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+
+
+def test_live_request_waits_for_one_batch_and_blocks_the_next():
+    gen = BlockingCaptionGenerator()
+    pool = CaptionPool(gen, FakeTemplateSelector(), split, target_size=16, low_water=4, batch_size=4)
+    refill = threading.Thread(target=pool.refill_once)
+    refill.start()
+    assert gen.started.wait(5)
+
+    entered = threading.Event()
+    refilled_during_live = []
+
+    def live():
+        with pool.live_request():
+            entered.set()
+            # While a live request is in flight, no new batch starts
+            refilled_during_live.append(pool.refill_once())
+
+    t = threading.Thread(target=live)
+    t.start()
+    time.sleep(0.05)
+    assert not entered.is_set()  # waiting on the running batch
+
+    gen.release.set()
+    refill.join(5)
+    t.join(5)
+    assert entered.is_set()
+    assert refilled_during_live == [0]
+    assert gen.prompts == 4
+
+
+def test_pool_hit_does_not_wait_for_running_batch():
+    pool = CaptionPool(FakeCaptionGenerator(), FakeTemplateSelector(), split,
+                       keys=[("road safety", "humorous", "generic_campaign")],
+                       target_size=2, low_water=2)
+    fill(pool)
+    pool.take("road safety", "humorous", "generic_campaign")  # 1 left, below low water
+
+    gen = BlockingCaptionGenerator()
+    pool.caption_gen = gen
+    refill = threading.Thread(target=pool.refill_once)
+    refill.start()
+    assert gen.started.wait(5)
+
+    start = time.monotonic()
+    entry = pool.take("road safety", "humorous", "generic_campaign")
+    elapsed = time.monotonic() - start
+
+    gen.release.set()
+    refill.join(5)
+    assert entry is not None
+    assert elapsed < 0.1
+
+
+def test_prompts_use_topic_text_not_lookup_key():
+    clock = FakeClock()
+    gen = FakeCaptionGenerator()
+    seen = []
+    original = gen.generate_batch
+
+    def record(requests, num_return_sequences=1):
+        seen.extend(topic for topic, _, _ in requests)
+        return original(requests, num_return_sequences)
+
+    gen.generate_batch = record
+    pool = CaptionPool(gen, FakeTemplateSelector(), split, promote_after=1, clock=clock)
+    pool.take("Save  Water", "humorous", "generic_campaign")
+    fill(pool)
+
+    assert set(seen) == {"road safety", "mental health", "cyberbullying", "Save  Water"}
+    assert "save_water|humorous|generic_campaign" in pool.stats()["slots"]
@@ -0,0 +1,154 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+
+from src.gemini.fake_upstream import FakeGeminiClient
+from src.gemini.scheduler import (
+    PRIORITY_HIGH,
+    DeadlineExceeded,
+    GeminiScheduler,
+    QueueFull,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, dt: float):
+        self.now += dt
+
+
+def start_requests(sched, specs):
+    """Start one thread per (contents, kwargs); returns threads and a results dict."""
+    results = {}
+
+    def worker(contents, kwargs):
+        try:
+            sched.generate_content(model="fake", contents=contents, **kwargs)
+            results[contents] = "ok"
+        except (DeadlineExceeded, QueueFull) as e:
+            results[contents] = type(e).__name__
+
+    threads = [threading.Thread(target=worker, args=spec, daemon=True) for spec in specs]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_until_queued(sched, n, timeout=5.0):
+    end = time.monotonic() + timeout
+    while sched.queue_depth() < n:
+        assert time.monotonic() < end, "requests never reached the scheduler queue"
+        time.sleep(0.0005)
+
+
+def drive(sched, clock, threads, step=1.0, max_steps=10000):
+    """
+    Advance the fake clock only while every outstanding request is parked in the
+    scheduler queue, so each admitted call reaches the upstream at the time it
+    was admitted.
+    """
+    for _ in range(max_steps):
+        alive = [t for t in threads if t.is_alive()]
+        if not alive:
+            return
+        if sched.queue_depth() == len(alive):
+            clock.advance(step)
+            sched.wake()
+        # Let woken waiters grab the lock before the clock moves again
+        time.sleep(0.001)
+    raise AssertionError("requests did not finish")
+
+
+def test_no_upstream_quota_errors_under_burst():
+    clock = FakeClock()
+    upstream = FakeGeminiClient(requests_per_minute=10, clock=clock)
+    sched = GeminiScheduler(upstream, requests_per_minute=10, burst=1,
+                            max_queue=64, default_timeout=None, clock=clock)
+
+    threads, results = start_requests(sched, [(f"r{i}", {}) for i in range(30)])
+    wait_until_queued(sched, 29)
+    drive(sched, clock, threads)
+
+    assert upstream.models.rejected == 0
+    assert upstream.models.accepted == 30
+    assert set(results.values()) == {"ok"}
+    # 30 calls at 10/min need at least three minutes of (fake) time
+    assert clock.now >= 170
+
+
+def test_configured_api_key_is_served_first():
+    clock = FakeClock()
+    upstream = FakeGeminiClient(requests_per_minute=60, clock=clock)
+    sched = GeminiScheduler(upstream, requests_per_minute=60, burst=1,
+                            priority_classes={"vip-key": PRIORITY_HIGH},
+                            campaigns=["road_safety"],
+                            default_timeout=None, clock=clock)
+    # Use up the initial token so everything below has to queue
+    sched.generate_content(model="fake", contents="warmup")
+
+    # Claiming a campaign name in the body must not buy priority
+    normal = [(f"normal{i}", {"campaign": "road_safety"}) for i in range(3)]
+    vip = [(f"vip{i}", {"api_key": "vip-key"}) for i in range(2)]
+    threads, results = start_requests(sched, normal)
+    wait_until_queued(sched, 3)
+    more, more_results = start_requests(sched, vip)
+    wait_until_queued(sched, 5)
+    drive(sched, clock, threads + more)
+
+    order = [contents for _, contents in upstream.models.calls[1:]]
+    assert order[:2] == ["vip0", "vip1"] or order[:2] == ["vip1", "vip0"]
+    assert sorted(order[2:]) == ["normal0", "normal1", "normal2"]
+
+
+def test_request_that_cannot_meet_deadline_is_dropped():
+    clock = FakeClock()
+    upstream = FakeGeminiClient(requests_per_minute=6, clock=clock)
+    sched = GeminiScheduler(upstream, requests_per_minute=6, burst=1, clock=clock)
+    sched.generate_content(model="fake", contents="warmup")
+
+    # Next token is 10s away
+    threads, results = start_requests(sched, [
+        ("too_late", {"timeout": 5.0}),
+        ("in_time", {"timeout": 60.0}),
+    ])
+    wait_until_queued(sched, 2)
+    drive(sched, clock, threads)
+
+    assert results == {"too_late": "DeadlineExceeded", "in_time": "ok"}
+    assert [c for _, c in upstream.models.calls] == ["warmup", "in_time"]
+    stats = sched.stats()["default"]
+    assert stats["calls"] == 2
+    assert stats["dropped"] == 1
+
+
+def test_full_queue_rejects_immediately():
+    clock = FakeClock()
+    upstream = FakeGeminiClient(requests_per_minute=60, clock=clock)
+    sched = GeminiScheduler(upstream, requests_per_minute=60, burst=1,
+                            max_queue=2, default_timeout=None, clock=clock)
+    sched.generate_content(model="fake", contents="warmup")
+
+    threads, _ = start_requests(sched, [("a", {}), ("b", {})])
+    wait_until_queued(sched, 2)
+    with pytest.raises(QueueFull):
+        sched.generate_content(model="fake", contents="c")
+    drive(sched, clock, threads)
+
+
+def test_unknown_campaigns_are_accounted_as_default():
+    upstream = FakeGeminiClient(requests_per_minute=100)
+    sched = GeminiScheduler(upstream, requests_per_minute=100, burst=5, campaigns=["road_safety"])
+    for campaign in ("road_safety", "made_up_1", "made_up_2"):
+        sched.generate_content(campaign=campaign, model="fake", contents=campaign)
+
+    stats = sched.stats()
+    assert set(stats) == {"road_safety", "default"}
+    assert stats["default"]["calls"] == 2
+    assert stats["default"]["image_bytes"] > 0